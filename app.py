@@ -4,6 +4,9 @@ QX Matrix Interactive Analyzer - Optimized Streamlit version
 Optimizations: Caching, lazy loading, vectorized operations
 """
 
+import hashlib
+import threading
+import numpy as np
 import pandas as pd
 import streamlit as st
 from pathlib import Path
@@ -17,75 +20,216 @@ st.set_page_config(
     layout="wide"
 )
 
+# Cell markers used in the matrix to link rows to component columns
+MARKERS = ['ê', 'è', 'ç', 'ª']
+# Markers that link a parameter row to a component column
+LINK_MARKERS = ['è', 'ê']
+# Integer code per marker; every other cell is encoded as 0
+MARKER_CODES = {marker: code for code, marker in enumerate(MARKERS, 1)}
+CODE_C = MARKER_CODES['ç']
+LINK_CODES = [MARKER_CODES[m] for m in LINK_MARKERS]
+# Minimum sheet shape: row 15 holds names, columns 75/76 hold subset/parameter info
+MIN_ROWS = 16
+MIN_COLUMNS = 77
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _find_defect_column(file_hash: str, defect_name, _row15_lower):
+    """Find column index for a defect type, keyed on file hash and defect name"""
+    # Plain substring test on precomputed lowercase names; faster than .str.contains
+    needle = defect_name.lower()
+    for col, name in enumerate(_row15_lower):
+        if name and needle in name:
+            return col
+    return None
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _list_all_defects(file_hash: str, _row15_str):
+    """List all defect types as (column, name) tuples, keyed on file hash"""
+    # Defects start from column 78 (CA in Excel)
+    names = _row15_str[78:]
+    cols = np.nonzero(names != '')[0]
+    return [(int(col) + 78, names[col]) for col in cols]
+
+
+def load_data(file_bytes: bytes):
+    """Load Excel file - called only from the cached build_analyzer, raises if unreadable"""
+    try:
+        # Try openpyxl first (for .xlsx)
+        data = pd.read_excel(BytesIO(file_bytes), header=None, engine='openpyxl')
+        engine = 'openpyxl'
+    except Exception:
+        # Try xlrd for old .xls files
+        data = pd.read_excel(BytesIO(file_bytes), header=None, engine='xlrd')
+        engine = 'xlrd'
+    return data, engine
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def build_analyzer(file_hash: str, _file_bytes: bytes):
+    """
+    Build a fully indexed analyzer for an uploaded file, reused across reruns.
+    
+    cache_resource (not cache_data) keeps the same object, so the numpy
+    indexes and the lazily opened xlrd workbook survive between reruns.
+    
+    Args:
+        file_hash: md5 of the file bytes, used as the cache key
+        _file_bytes: Raw Excel file contents (not hashed by Streamlit)
+    
+    Returns:
+        Tuple (analyzer, error): analyzer is None and error holds the reason
+        when the file cannot be used; the caller reports it once
+    """
+    try:
+        data, engine = load_data(_file_bytes)
+    except Exception as e:
+        return None, f"Impossible de charger le fichier: {e}"
+    
+    # Validate the shape once so lookups below need no per-cell bounds checks
+    if data.shape[0] < MIN_ROWS or data.shape[1] < MIN_COLUMNS:
+        return None, (
+            f"Feuille trop petite: {data.shape[0]} lignes × {data.shape[1]} colonnes "
+            f"(minimum {MIN_ROWS} × {MIN_COLUMNS})"
+        )
+    
+    analyzer = QXMatrixAnalyzer(_file_bytes, file_hash)
+    analyzer.data = data
+    analyzer.engine = engine
+    analyzer._build_indexes()
+    return analyzer, None
+
 
 class QXMatrixAnalyzer:
     """Optimized analyzer for QX matrix Excel files"""
 
-    def __init__(self, excel_file):
-        """Initialize analyzer with an Excel file"""
-        self.excel_file = excel_file
+    def __init__(self, file_bytes, file_hash=None):
+        """Initialize analyzer with the raw bytes of an Excel file"""
+        self.file_bytes = file_bytes
+        self.file_hash = file_hash
         self.data = None
+        self.engine = None
         self._xlrd_book = None
         self._xlrd_sheet = None
-        
-    @st.cache_data(show_spinner=False)
-    def load_data(_self, file_bytes):
-        """Load Excel file - cached for performance"""
-        try:
-            # Try openpyxl first (for .xlsx)
-            data = pd.read_excel(BytesIO(file_bytes), header=None, engine='openpyxl')
-            engine = 'openpyxl'
-        except Exception:
-            try:
-                # Try xlrd for old .xls files
-                data = pd.read_excel(BytesIO(file_bytes), header=None, engine='xlrd')
-                engine = 'xlrd'
-            except Exception as e:
-                st.error(f"Unable to load file: {e}")
-                return None, None
-        return data, engine
-    
+        self._subname_to_xlrd_row = {}
+        self._color_grid = None
+        # The analyzer is shared across sessions (cache_resource): guard the lazy xlrd init
+        self._xlrd_lock = threading.Lock()
+        self._row15 = None
+        self._row15_str = None
+        self._row15_lower = None
+        self._name_to_cols = {}
+        self._sub_index = {}
+        self._linked_mask = None
+        self._codes = None
+
+    def _build_indexes(self):
+        """Precompute row-15 lookups once after data is loaded"""
+        if self.data is None:
+            return
+
+        self._row15 = self.data.iloc[15].to_numpy()
+        self._row15_str = np.array(
+            [str(v).strip() if pd.notna(v) else '' for v in self._row15],
+            dtype=object
+        )
+        self._row15_lower = np.array([s.lower() for s in self._row15_str], dtype=object)
+
+        # Component name -> column indices (components are in columns 0-73)
+        self._name_to_cols = {}
+        for col, name in enumerate(self._row15_str[:74]):
+            if name:
+                self._name_to_cols.setdefault(name, []).append(col)
+
+        # Encode every cell to a uint32 marker code once; scans below are integer compares.
+        # A Categorical compares only the distinct strings to the markers, then its
+        # integer category codes broadcast the result to every cell.
+        # Empty cells become '' explicitly: how astype(str) renders NaN varies across pandas
+        stripped = self.data.fillna('').astype(str).apply(lambda s: s.str.strip()).to_numpy()
+        cells = pd.Categorical(stripped.ravel())
+        category_codes = np.array(
+            [MARKER_CODES.get(c, 0) for c in cells.categories], dtype=np.uint32
+        )
+        # Append a 0 slot so any missing-value code (-1) maps to 0, not the last category
+        self._codes = np.append(category_codes, 0)[cells.codes].reshape(self.data.shape)
+
+        # Sub-assembly name -> (row index, marked component columns), rows 3-13
+        self._sub_index = {}
+        subs_col = self.data.iloc[3:14, 75]
+        for row_idx, sub_name in zip(range(3, 14), subs_col):
+            if pd.isna(sub_name):
+                continue
+            name = str(sub_name).strip()
+            if name in self._sub_index:
+                continue  # keep first matching row
+            markers_mask = self._codes[row_idx, 0:74] != 0
+            self._sub_index[name] = (row_idx, np.where(markers_mask)[0])
+
+        # Parameter rows (17+) x component columns: True where a link marker is set
+        self._linked_mask = np.isin(self._codes[17:, :74], LINK_CODES)
+
     def _get_xlrd_objects(self):
         """Lazy load xlrd objects only when needed for color information"""
-        if self._xlrd_book is None:
+        if self._xlrd_book is not None:
+            return self._xlrd_book, self._xlrd_sheet
+        
+        with self._xlrd_lock:
+            # Another session may have finished the init while we waited
+            if self._xlrd_book is not None:
+                return self._xlrd_book, self._xlrd_sheet
+            
             try:
                 import xlrd
-                self._xlrd_book = xlrd.open_workbook(
-                    file_contents=self.excel_file.read(),
+                book = xlrd.open_workbook(
+                    file_contents=self.file_bytes,
                     formatting_info=True
                 )
-                self._xlrd_sheet = self._xlrd_book.sheet_by_index(0)
-                self.excel_file.seek(0)  # Reset file pointer
+                sheet = book.sheet_by_index(0)
+                
+                # Subset name -> xlrd row, first match in rows 3-14
+                subname_to_row = {}
+                if sheet.ncols > 75:
+                    for r in range(3, min(15, sheet.nrows)):
+                        cell = sheet.cell(r, 75)
+                        if cell.ctype == xlrd.XL_CELL_TEXT:
+                            subname_to_row.setdefault(cell.value.strip(), r)
+                
+                # Background color index of every cell, extracted in one pass
+                xf_list = book.xf_list
+                color_grid = np.full((sheet.nrows, sheet.ncols), -1, dtype=np.int16)
+                for r in range(sheet.nrows):
+                    for c in range(sheet.ncols):
+                        color_grid[r, c] = xf_list[sheet.cell_xf_index(r, c)].background.pattern_colour_index
             except Exception as e:
+                self._xlrd_book = None
+                self._xlrd_sheet = None
+                self._subname_to_xlrd_row = {}
+                self._color_grid = None
                 st.warning(f"Color information not available: {e}")
                 return None, None
+            
+            # Publish the book last: a non-None book means every index is ready
+            self._subname_to_xlrd_row = subname_to_row
+            self._color_grid = color_grid
+            self._xlrd_sheet = sheet
+            self._xlrd_book = book
         return self._xlrd_book, self._xlrd_sheet
     
     def get_cell_color(self, row_name, col_idx):
-        """Get cell background color"""
+        """Get cell background color - O(1) lookup in the precomputed color grid"""
         book, sheet = self._get_xlrd_objects()
         if not book or not sheet:
             return None, None
             
         try:
-            import xlrd
             # Find row index for the subset
-            row_idx = None
-            for r in range(3, 15):
-                cell = sheet.cell(r, 75)
-                if cell.ctype == xlrd.XL_CELL_TEXT and cell.value.strip() == row_name:
-                    row_idx = r
-                    break
-            
+            row_idx = self._subname_to_xlrd_row.get(row_name)
             if row_idx is None:
                 return None, None
                 
-            xf_index = sheet.cell_xf_index(row_idx, col_idx)
-            xf = book.xf_list[xf_index]
-            bg_color_index = xf.background.pattern_colour_index
-            palette = book.colour_map
-            rgb = palette.get(bg_color_index)
-            return bg_color_index, rgb
+            bg_color_index = int(self._color_grid[row_idx, col_idx])
+            return bg_color_index, book.colour_map.get(bg_color_index)
         except Exception as e:
             return None, f"Error: {e}"
     
@@ -94,62 +238,30 @@ class QXMatrixAnalyzer:
         return self.get_cell_color(row_name, col_idx)
     
     def find_defect_column(self, defect_name):
-        """Find column index for a specific defect type - optimized"""
-        if self.data is None:
-            return None
-            
-        defect_row_idx = 15
-        if defect_row_idx >= len(self.data):
+        """Find column index for a specific defect type - cached per file"""
+        if self._row15_lower is None:
             return None
-        
-        # Vectorized search
-        defect_row = self.data.iloc[defect_row_idx]
-        mask = defect_row.notna() & defect_row.astype(str).str.lower().str.contains(defect_name.lower(), na=False)
-        matches = defect_row[mask]
-        
-        return matches.index[0] if len(matches) > 0 else None
+        return _find_defect_column(self.file_hash, defect_name, self._row15_lower)
     
     def list_all_defects(self):
-        """List all defect types - optimized with vectorization"""
-        if self.data is None:
-            return []
-            
-        defect_row_idx = 15
-        if defect_row_idx >= len(self.data):
+        """List all defect types - cached per file"""
+        if self._row15_str is None:
             return []
-        
-        defect_row = self.data.iloc[defect_row_idx]
-        
-        # Vectorized filtering
-        valid_mask = defect_row.notna() & (defect_row.astype(str).str.strip() != '')
-        valid_defects = defect_row[valid_mask]
-        
-        # Filter to start from column 78 (CA in Excel)
-        valid_defects = valid_defects[valid_defects.index >= 78]
-        
-        return [(col, str(val).strip()) for col, val in valid_defects.items()]
+        return _list_all_defects(self.file_hash, self._row15_str)
     
     def get_sous_ensembles(self, defect_col, defect_name=None):
         """Get all subsets associated with a defect column"""
-        sous_ensembles = []
-        
-
-        
         # Rule: each line 3-14 where defect column equals 'ç' is a subset
-        target_marker = 'ç'
-        for row_idx in range(3, 15):
-            if row_idx < len(self.data) and defect_col < len(self.data.columns):
-                cell = self.data.iloc[row_idx, defect_col]
-                if pd.notna(cell) and str(cell).strip() == target_marker:
-                    sub_name = self.data.iloc[row_idx, 75] if 75 < len(self.data.columns) else None
-                    if pd.notna(sub_name):
-                        name = str(sub_name).strip()
-                        if name and name not in sous_ensembles:
-                            sous_ensembles.append(name)
+        mask = self._codes[3:15, defect_col] == CODE_C
+        names_col = self.data.iloc[3:15, 75]
+        names = names_col.fillna('').astype(str).str.strip().to_numpy()
+        valid = mask & names_col.notna().to_numpy() & (names != '')
+        # dict.fromkeys dedupes while preserving row order
+        sous_ensembles = list(dict.fromkeys(names[valid]))
         
         # Fallback: if nothing found, try (13, 75)
         if not sous_ensembles:
-            sub_name = self.data.iloc[13, 75] if 75 < len(self.data.columns) else None
+            sub_name = self.data.iloc[13, 75]
             if pd.notna(sub_name):
                 sous_ensembles.append(str(sub_name).strip())
         
@@ -157,33 +269,16 @@ class QXMatrixAnalyzer:
     
     def get_composants(self, sous_ensemble_name):
         """Get all components belonging to a sub-assembly"""
-        components = []
-        
-        # Find the row with this sub-assembly name
-        sub_row_idx = None
-        for row_idx in range(3, 14):
-            sub_name = self.data.iloc[row_idx, 75] if 75 < len(self.data.columns) else None
-            if pd.notna(sub_name) and str(sub_name).strip() == sous_ensemble_name:
-                sub_row_idx = row_idx
-                break
-        
-        if sub_row_idx is None:
-            return components
-        
-        # Find columns with markers in this row
-        markers = ['ê', 'è', 'ç', 'ª']
-        for col in range(0, 74):  # Components are in columns 0-73
-            if col < len(self.data.columns):
-                marker = str(self.data.iloc[sub_row_idx, col]).strip()
-                if marker in markers:
-                    # Get component name from row 15
-                    component = self.data.iloc[15, col] if col < len(self.data.columns) else None
-                    if pd.notna(component):
-                        comp_name = str(component).strip()
-                        if comp_name not in markers and comp_name != '':
-                            components.append(comp_name)
-        
-        return components
+        entry = self._sub_index.get(sous_ensemble_name)
+        if entry is None:
+            return []
+        
+        # Component names come from row 15 of the marked columns
+        _, component_cols = entry
+        return [
+            comp_name for comp_name in self._row15_str[component_cols]
+            if comp_name not in MARKERS and comp_name != ''
+        ]
     
     def get_component_parameters_mapping(self, parameters_with_components):
         """
@@ -226,51 +321,30 @@ class QXMatrixAnalyzer:
         if not sous_ensemble_name:
             return parameters
         
-        # First, find all component columns for this sub-assembly
-        component_cols = []
-        sub_row_idx = None
-        
-        # Find the row with this sub-assembly
-        for row_idx in range(3, 14):
-            sub_name = self.data.iloc[row_idx, 75] if 75 < len(self.data.columns) else None
-            if pd.notna(sub_name) and str(sub_name).strip() == sous_ensemble_name:
-                sub_row_idx = row_idx
-                break
-        
-        if sub_row_idx is None:
+        # Component columns with markers in this sub-assembly row
+        entry = self._sub_index.get(sous_ensemble_name)
+        if entry is None:
             return parameters
-        
-        # Find component columns with markers in this sub-assembly row
-        markers = ['ê', 'è', 'ç', 'ª']
-        for col in range(0, 74):
-            if col < len(self.data.columns):
-                marker = str(self.data.iloc[sub_row_idx, col]).strip()
-                if marker in markers:
-                    component_cols.append(col)
-        
-        # Now find parameters linked to these components
-        for row_idx in range(17, len(self.data)):
-            param_name = self.data.iloc[row_idx, 75] if 75 < len(self.data.columns) else None
-            param_value = self.data.iloc[row_idx, 76] if 76 < len(self.data.columns) else None
+        _, component_cols = entry
+        
+        # Only rows where at least one of our components carries a link marker
+        sub = self._linked_mask[:, component_cols]
+        for offset in np.where(sub.any(axis=1))[0]:
+            row_idx = 17 + offset
+            param_name = self.data.iloc[row_idx, 75]
+            param_value = self.data.iloc[row_idx, 76]
             
             if pd.notna(param_name):
                 param_name_str = str(param_name).strip()
                 param_value_str = str(param_value).strip() if pd.notna(param_value) else ""
                 
-                # Check if any component in our sub-assembly has a marker in this row
-                linked_components = []
-                for col in component_cols:
-                    if col < len(self.data.columns):
-                        cell = self.data.iloc[row_idx, col]
-                        if pd.notna(cell) and str(cell).strip() in ['è', 'ê']:
-                            # Get component name from row 15
-                            comp_name = self.data.iloc[15, col] if col < len(self.data.columns) else None
-                            if pd.notna(comp_name):
-                                comp_name_str = str(comp_name).strip()
-                                if comp_name_str not in markers and comp_name_str != '':
-                                    linked_components.append(comp_name_str)
+                # Component names (row 15) of the linked columns
+                linked_components = [
+                    comp_name for comp_name in self._row15_str[component_cols[sub[offset]]]
+                    if comp_name not in MARKERS and comp_name != ''
+                ]
                 
-                if linked_components and param_name_str not in markers and param_name_str != '':
+                if linked_components and param_name_str not in MARKERS and param_name_str != '':
                     parameters.append({
                         'name': param_name_str,
                         'value': param_value_str,
@@ -301,12 +375,7 @@ class QXMatrixAnalyzer:
             parametres.extend(self.get_parametres(se))
         
         # Déduplication des composants en conservant l'ordre
-        seen = set()
-        composants_uniques = []
-        for comp in composants:
-            if comp not in seen:
-                seen.add(comp)
-                composants_uniques.append(comp)
+        composants_uniques = list(dict.fromkeys(composants))
         
         return {
             'defect_name': defect_name,
@@ -337,7 +406,12 @@ class QXMatrixAnalyzer:
         bonnes_composants = []
         color_cache = {}
         
-        if sous_ensembles:
+        book, _ = self._get_xlrd_objects()
+        if book is None:
+            # No color information (e.g. .xlsx): every None == None would match,
+            # so skip color filtering and keep all components
+            bonnes_composants = result['composants']
+        elif sous_ensembles:
             for se in sous_ensembles:
                 if se not in color_cache:
                     color_idx, _ = self.get_cell_color(se, defect_col)
@@ -346,26 +420,15 @@ class QXMatrixAnalyzer:
                 color_idx = color_cache[se]
                 
                 for comp in result['composants']:
-                    comp_cols = []
-                    comp_name = comp.strip()
-                    
-                    for col in range(0, 74):
-                        cell_val = self.data.iloc[15, col]
-                        if pd.notna(cell_val) and str(cell_val).strip() == comp_name:
-                            comp_cols.append(col)
-                    
+                    comp_cols = self._name_to_cols.get(comp.strip(), [])
+
                     for comp_col in comp_cols:
                         comp_color_idx, _ = self.get_component_color(se, comp_col)
                         if comp_color_idx == color_idx:
                             bonnes_composants.append(comp)
         
         # Déduplication
-        bonnes_composants_uniques = []
-        seen = set()
-        for comp in bonnes_composants:
-            if comp not in seen:
-                seen.add(comp)
-                bonnes_composants_uniques.append(comp)
+        bonnes_composants_uniques = list(dict.fromkeys(bonnes_composants))
         
         # Section 4 - Paramètres pour les bonnes composants
         parametres_filtres = []
@@ -389,6 +452,13 @@ class QXMatrixAnalyzer:
         }
 
 
+def _csv_field(value):
+    """Quote a CSV field only if it contains a separator, quote or newline"""
+    if any(ch in value for ch in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
 def display_hierarchy(result):
     """Display hierarchy in Streamlit with nice formatting"""
     st.markdown("---")
@@ -501,76 +571,77 @@ def display_components_to_parameters(analyzer, result):
 def export_to_pdf(result):
     """Export hierarchy to PDF format"""
     try:
-        from fpdf import FPDF
+        from fpdf import FPDF, XPos, YPos
+        
+        # Move to the start of the next line after a cell (fpdf2 replacement for ln=True)
+        next_line = {'new_x': XPos.LMARGIN, 'new_y': YPos.NEXT}
         
         pdf = FPDF()
         pdf.add_page()
         pdf.set_auto_page_break(auto=True, margin=15)
         
         # Title
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, f"Hierarchie pour: {result['defect_name']}", ln=True, align='C')
+        pdf.set_font("Helvetica", 'B', 16)
+        pdf.cell(0, 10, f"Hierarchie pour: {result['defect_name']}", align='C', **next_line)
         pdf.ln(5)
         
         # Section 1 - Type de défaut
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "1 - Type de defaut", ln=True)
-        pdf.set_font("Arial", '', 12)
-        pdf.cell(0, 8, f"Nom: {result['defect_name']}", ln=True)
+        pdf.set_font("Helvetica", 'B', 14)
+        pdf.cell(0, 10, "1 - Type de defaut", **next_line)
+        pdf.set_font("Helvetica", '', 12)
+        pdf.cell(0, 8, f"Nom: {result['defect_name']}", **next_line)
         if result['defect_column'] is not None:
-            pdf.cell(0, 8, f"Colonne: {result['defect_column']}", ln=True)
+            pdf.cell(0, 8, f"Colonne: {result['defect_column']}", **next_line)
         pdf.ln(5)
         
         # Section 2 - Sous-ensembles
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "2 - Sous-ensembles", ln=True)
-        pdf.set_font("Arial", '', 12)
+        pdf.set_font("Helvetica", 'B', 14)
+        pdf.cell(0, 10, "2 - Sous-ensembles", **next_line)
+        pdf.set_font("Helvetica", '', 12)
         if result['sous_ensembles']:
-            for se in result['sous_ensembles']:
-                pdf.cell(0, 8, f"  - {se}", ln=True)
+            body = "\n".join(f"  - {se}" for se in result['sous_ensembles'])
+            pdf.multi_cell(0, 8, body, **next_line)
         else:
-            pdf.cell(0, 8, "  Non trouve", ln=True)
+            pdf.cell(0, 8, "  Non trouve", **next_line)
         pdf.ln(5)
         
         # Section 3 - Composants
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, f"3 - Bonnes composants ({len(result['bonnes_composants'])})", ln=True)
-        pdf.set_font("Arial", '', 12)
+        pdf.set_font("Helvetica", 'B', 14)
+        pdf.cell(0, 10, f"3 - Bonnes composants ({len(result['bonnes_composants'])})", **next_line)
+        pdf.set_font("Helvetica", '', 12)
         if result['bonnes_composants']:
-            for i, comp in enumerate(result['bonnes_composants'], 1):
-                # Handle long component names
-                pdf.multi_cell(0, 8, f"  {i}. {comp}")
+            # One multi_cell for the whole list; long names still wrap
+            body = "\n".join(f"  {i}. {comp}" for i, comp in enumerate(result['bonnes_composants'], 1))
+            pdf.multi_cell(0, 8, body, **next_line)
         else:
-            pdf.cell(0, 8, "  (Aucun composant trouve)", ln=True)
+            pdf.cell(0, 8, "  (Aucun composant trouve)", **next_line)
         pdf.ln(5)
         
         # Section 4 - Paramètres
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, f"4 - Parametres composant ({len(result['parametres'])})", ln=True)
-        pdf.set_font("Arial", '', 12)
+        pdf.set_font("Helvetica", 'B', 14)
+        pdf.cell(0, 10, f"4 - Parametres composant ({len(result['parametres'])})", **next_line)
         if result['parametres']:
             for param in result['parametres']:
-                pdf.set_font("Arial", 'B', 12)
-                pdf.multi_cell(0, 8, f"  * {param['name']}")
-                pdf.set_font("Arial", '', 12)
+                pdf.set_font("Helvetica", 'B', 12)
+                pdf.multi_cell(0, 8, f"  * {param['name']}", **next_line)
+                pdf.set_font("Helvetica", '', 12)
+                lines = []
                 if param['value']:
-                    pdf.multi_cell(0, 8, f"    Action: {param['value']}")
-                comp_str = ', '.join(param['components'])
-                pdf.multi_cell(0, 8, f"    Composants lies: {comp_str}")
+                    lines.append(f"    Action: {param['value']}")
+                lines.append(f"    Composants lies: {', '.join(param['components'])}")
+                pdf.multi_cell(0, 8, "\n".join(lines), **next_line)
                 pdf.ln(3)
         else:
-            pdf.cell(0, 8, "  (Aucun parametre trouve)", ln=True)
+            pdf.set_font("Helvetica", '', 12)
+            pdf.cell(0, 8, "  (Aucun parametre trouve)", **next_line)
         
         # Footer
         pdf.ln(10)
-        pdf.set_font("Arial", 'I', 10)
-        pdf.cell(0, 8, f"Genere automatiquement depuis: {result['defect_name']}", ln=True, align='C')
+        pdf.set_font("Helvetica", 'I', 10)
+        pdf.cell(0, 8, f"Genere automatiquement depuis: {result['defect_name']}", align='C', **next_line)
         
         # Return PDF as bytes
-        pdf_output = pdf.output(dest='S')
-        if isinstance(pdf_output, str):
-            return pdf_output.encode('latin-1')
-        return pdf_output
+        return bytes(pdf.output())
     except ImportError:
         return None
 
@@ -610,19 +681,25 @@ def main():
         return
     
     # Initialize analyzer
-    file_bytes = uploaded_file.read()
-    uploaded_file.seek(0)  # Reset file pointer
+    # Read the upload once per file; reruns reuse the bytes and hash from session state
+    if st.session_state.get('file_id') != uploaded_file.file_id:
+        st.session_state.file_bytes = uploaded_file.getvalue()
+        st.session_state.file_hash = hashlib.md5(st.session_state.file_bytes).hexdigest()
+        st.session_state.file_id = uploaded_file.file_id
     
     with st.spinner("Chargement des données..."):
-        analyzer = QXMatrixAnalyzer(uploaded_file)
-        data, engine = analyzer.load_data(file_bytes)
+        analyzer, error = build_analyzer(st.session_state.file_hash, st.session_state.file_bytes)
         
-        if data is None:
-            st.error("Impossible de charger le fichier")
+        if analyzer is None:
+            st.error(error)
             return
         
-        analyzer.data = data
-        st.success(f"✓ Chargé avec {engine} | {len(data)} lignes × {len(data.columns)} colonnes")
+        data = analyzer.data
+        st.success(f"✓ Chargé avec {analyzer.engine} | {len(data)} lignes × {len(data.columns)} colonnes")
+    
+    # List defects once per rerun; every tab below reuses it
+    with st.spinner("Chargement des défauts..."):
+        defects = analyzer.list_all_defects()
     
     # Tabs for different functionalities
     tab1, tab2, tab3 = st.tabs(["📋 Liste des défauts", "🔍 Analyser un défaut", "🔎 Recherche"])
@@ -630,11 +707,6 @@ def main():
     with tab1:
         st.header("Liste de tous les types de défaut")
         
-        with st.spinner("Chargement des défauts..."):
-            start = time.time()
-            defects = analyzer.list_all_defects()
-            elapsed = time.time() - start
-        
         st.metric("Nombre de défauts", len(defects))
         
         if defects:
@@ -647,8 +719,8 @@ def main():
                 hide_index=True
             )
             
-            # Download button
-            csv = df.to_csv(index=False)
+            # Download button - single-column CSV built directly, quoting only when needed
+            csv = "Type de défaut\n" + "".join(f"{_csv_field(name)}\n" for _, name in defects)
             st.download_button(
                 label="📥 Télécharger en CSV",
                 data=csv,
@@ -659,8 +731,7 @@ def main():
     with tab2:
         st.header("Analyser un défaut spécifique")
         
-        # Get list of defects for autocomplete
-        defects = analyzer.list_all_defects()
+        # Defect names for autocomplete
         defect_names = [d[1] for d in defects]
         
         selected_defect = st.selectbox(
@@ -692,7 +763,6 @@ def main():
         keyword = st.text_input("🔎 Entrer un mot-clé", "")
         
         if keyword:
-            defects = analyzer.list_all_defects()
             matches = [(col, d) for col, d in defects if keyword.lower() in d.lower()]
             
             if matches: